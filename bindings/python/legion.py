@@ -23,13 +23,17 @@ try:
 except ImportError:
     import pickle
 import collections
-import itertools
+import hashlib
 import numpy
 import os
-import re
-import subprocess
+import struct
 import sys
 import threading
+import warnings
+
+from legion_header import find_legion_header, legion_headers, \
+    preprocess_legion_header, preprocessed_header_name, \
+    read_preprocessed_header
 
 # Python 3.x compatibility:
 try:
@@ -42,62 +46,187 @@ try:
 except NameError:
     xrange = range # Python 3
 
-try:
-    zip_longest = itertools.izip_longest # Python 2
-except:
-    zip_longest = itertools.zip_longest # Python 3
-
 _pickle_version = pickle.HIGHEST_PROTOCOL # Use latest Pickle protocol
 
-def find_legion_header():
-    def try_prefix(prefix_dir):
-        legion_h_path = os.path.join(prefix_dir, 'legion.h')
-        if os.path.exists(legion_h_path):
-            return prefix_dir, legion_h_path
-
-    # For in-source builds, find the header relative to the bindings
-    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
-    runtime_dir = os.path.join(root_dir, 'runtime')
-    result = try_prefix(runtime_dir)
-    if result:
+# Task arguments and results are frequently just a few integers, for
+# which the Pickle machinery is mostly overhead. Values of these types
+# are encoded as a one-byte tag followed by the packed value, and
+# everything else falls back to Pickle. The tags cannot be confused
+# with a Pickle stream, which always starts with the PROTO opcode
+# (0x80) at protocol 2 and above.
+_uint8_struct = struct.Struct(b'<B')
+_int64_struct = struct.Struct(b'<q')
+_float64_struct = struct.Struct(b'<d')
+
+# Tuples of ints are packed directly, while tuples mixing ints and
+# floats are encoded with their signature (one struct code per
+# element) ahead of the packed values. The compiled structs are cached
+# per signature, up to a limit so that arbitrary signatures cannot
+# grow the cache without bound.
+_tuple_struct_cache_limit = 256
+_tuple_structs = {}
+
+def _tuple_struct(codes):
+    try:
+        return _tuple_structs[codes]
+    except KeyError:
+        result = struct.Struct(b'<' + codes)
+        if len(_tuple_structs) < _tuple_struct_cache_limit:
+            _tuple_structs[codes] = result
         return result
 
-    # If this was installed to a non-standard prefix, we might be able
-    # to guess from the directory structures
-    if os.path.basename(root_dir) == 'lib':
-        include_dir = os.path.join(os.path.dirname(root_dir), 'include')
-        result = try_prefix(include_dir)
-        if result:
-            return result
-
-    # Otherwise we have to hope that Legion is installed in a standard location
-    result = try_prefix('/usr/include')
-    if result:
-        return result
+def _encode_value(value):
+    if value is None:
+        return b'n'
+    value_type = type(value)
+    if value_type is bool:
+        return b'T' if value else b'F'
+    try:
+        if value_type is int:
+            return b'i' + _int64_struct.pack(value)
+        if value_type is float:
+            return b'd' + _float64_struct.pack(value)
+        if value_type is bytes:
+            return b'b' + value
+        if value_type is tuple and all(type(x) is int for x in value):
+            return b't' + _tuple_struct(b'q' * len(value)).pack(*value)
+        if value_type is tuple and len(value) < 256 and \
+           all(type(x) is int or type(x) is float for x in value):
+            codes = b''.join(b'q' if type(x) is int else b'd' for x in value)
+            return b''.join((b's', _uint8_struct.pack(len(value)), codes,
+                             _tuple_struct(codes).pack(*value)))
+    except struct.error:
+        pass # Out of range for the packed encoding
+    return pickle.dumps(value, protocol=_pickle_version)
+
+def _decode_value(value_str):
+    tag = value_str[:1]
+    if tag == b'i':
+        return _int64_struct.unpack_from(value_str, 1)[0]
+    if tag == b'd':
+        return _float64_struct.unpack_from(value_str, 1)[0]
+    if tag == b'b':
+        return value_str[1:]
+    if tag == b't':
+        return _tuple_struct(
+            b'q' * ((len(value_str) - 1) // 8)).unpack_from(value_str, 1)
+    if tag == b's':
+        codes = value_str[2:2 + _uint8_struct.unpack_from(value_str, 1)[0]]
+        return _tuple_struct(codes).unpack_from(value_str, 2 + len(codes))
+    if tag == b'n':
+        return None
+    if tag == b'T':
+        return True
+    if tag == b'F':
+        return False
+    return pickle.loads(value_str)
+
+# Names passed to the runtime (field names, task modules) tend to
+# recur, so their UTF-8 encodings are interned rather than encoded
+# again each time.
+_utf8_cache = {}
 
-    result = try_prefix('/usr/local/include')
-    if result:
+def _encode_utf8(name):
+    try:
+        return _utf8_cache[name]
+    except KeyError:
+        result = _utf8_cache[name] = name.encode('utf-8')
         return result
 
-    raise Exception('Unable to locate legion.h header file')
+# Preprocessing and parsing the header takes a significant fraction of
+# the time to import this module. To avoid paying for it on every
+# import, the parsed declarations are saved as an out-of-line cffi
+# module in a per-user cache, keyed on the headers that went into it.
+def _cffi_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    if not cache_home:
+        cache_home = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'legion_python')
+
+def _cffi_cache_module_name(prefix_dir):
+    key = hashlib.sha1()
+    key.update(cffi.__version__.encode('utf-8'))
+    for header_name in legion_headers:
+        header_path = os.path.join(prefix_dir, header_name)
+        key.update(header_path.encode('utf-8'))
+        if os.path.exists(header_path):
+            stat = os.stat(header_path)
+            key.update(('%s:%s' % (stat.st_mtime, stat.st_size)).encode('utf-8'))
+    return '_legion_cffi_%s' % key.hexdigest()[:16]
+
+def _load_module_from_path(module_name, module_path):
+    try:
+        import importlib.util
+    except ImportError: # Python 2
+        import imp
+        return imp.load_source(module_name, module_path)
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_legion_ffi(prefix_dir, legion_h_path):
+    cache_dir = _cffi_cache_dir()
+    module_name = _cffi_cache_module_name(prefix_dir)
+    module_path = os.path.join(cache_dir, '%s.py' % module_name)
+
+    if os.path.exists(module_path):
+        return _load_module_from_path(module_name, module_path).ffi
+
+    # Prefer the header preprocessed at build time, if there is one,
+    # over invoking the compiler.
+    header = read_preprocessed_header(
+        prefix_dir,
+        os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                     preprocessed_header_name))
+    if header is None:
+        header = preprocess_legion_header(prefix_dir, legion_h_path)
+    builder = cffi.FFI()
+    builder.cdef(header)
+    builder.set_source(module_name, None)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Note: cffi writes the module to a temporary file and renames
+        # it into place, so concurrent imports never observe a
+        # partially written module.
+        module_path = builder.compile(tmpdir=cache_dir)
+    except (IOError, OSError):
+        # The cache is not writable, so fall back to the in-line FFI.
+        return builder
+    return _load_module_from_path(module_name, module_path).ffi
 
 prefix_dir, legion_h_path = find_legion_header()
-header = subprocess.check_output(['gcc', '-I', prefix_dir, '-E', '-P', legion_h_path]).decode('utf-8')
-
-# Hack: Fix for Ubuntu 16.04 versions of standard library headers:
-header = re.sub(r'typedef struct {.+?} max_align_t;', '', header, flags=re.DOTALL)
-
-ffi = cffi.FFI()
-ffi.cdef(header)
+ffi = load_legion_ffi(prefix_dir, legion_h_path)
 c = ffi.dlopen(None)
 
+# Dimension-specific entry points, indexed by dimension. Resolving
+# these once up front avoids formatting the symbol name and looking
+# it up in the library on every call.
+_max_dim = c.MAX_POINT_DIM
+_rect_ptr_types = (None,) + tuple(
+    ffi.typeof('legion_rect_{}d_t *'.format(dim))
+    for dim in xrange(1, _max_dim + 1))
+_domain_from_rect = (None,) + tuple(
+    getattr(c, 'legion_domain_from_rect_{}d'.format(dim))
+    for dim in xrange(1, _max_dim + 1))
+_domain_get_rect = (None,) + tuple(
+    getattr(c, 'legion_domain_get_rect_{}d'.format(dim))
+    for dim in xrange(1, _max_dim + 1))
+_get_field_accessor_array = (None,) + tuple(
+    getattr(c, 'legion_physical_region_get_field_accessor_array_{}d'.format(dim))
+    for dim in xrange(1, _max_dim + 1))
+_accessor_array_raw_rect_ptr = (None,) + tuple(
+    getattr(c, 'legion_accessor_array_{}d_raw_rect_ptr'.format(dim))
+    for dim in xrange(1, _max_dim + 1))
+
 # Returns true if this module is running inside of a Legion
 # executable. If false, then other Legion functionality should not be
 # expected to work.
 def inside_legion_executable():
     try:
         c.legion_get_current_time_in_micros()
-    except AttributeError:
+    except (AttributeError, ffi.error):
         return False
     else:
         return True
@@ -138,15 +267,21 @@ _my = threading.local()
 
 class Context(object):
     __slots__ = ['context_root', 'context', 'runtime_root', 'runtime',
-                 'task_root', 'task', 'regions', 'current_launch']
-    def __init__(self, context_root, runtime_root, task_root, regions):
+                 'task_root', 'task', 'regions_root', 'regions',
+                 'num_regions', 'current_launch']
+    def __init__(self, context_root, runtime_root, task_root,
+                 regions_root, num_regions):
         self.context_root = context_root
         self.context = self.context_root[0]
         self.runtime_root = runtime_root
         self.runtime = self.runtime_root[0]
         self.task_root = task_root
         self.task = self.task_root[0]
-        self.regions = regions
+        # Note: The physical regions are kept as the raw array
+        # returned by the preamble rather than copied into a list.
+        self.regions_root = regions_root
+        self.regions = self.regions_root[0]
+        self.num_regions = num_regions
         self.current_launch = None
     def begin_launch(self, launch):
         assert self.current_launch == None
@@ -155,6 +290,33 @@ class Context(object):
         assert self.current_launch == launch
         self.current_launch = None
 
+# Rects and byte offsets passed to or returned from a single C call
+# are only needed for the duration of that call, so each thread keeps
+# one set of these per dimension and reuses it.
+def _scratch_rect_and_offsets(dim):
+    try:
+        scratch = _my.scratch_rect_and_offsets
+    except AttributeError:
+        scratch = _my.scratch_rect_and_offsets = [None] * (_max_dim + 1)
+    result = scratch[dim]
+    if result is None:
+        result = scratch[dim] = (
+            ffi.new(_rect_ptr_types[dim]),
+            ffi.new('legion_byte_offset_t[]', dim))
+    return result
+
+# Task arguments are passed to the runtime by value, so each thread
+# reuses a single struct to stage them. Empty arguments never change
+# and are shared by every thread.
+_empty_task_argument = ffi.new('legion_task_argument_t *', [ffi.NULL, 0])
+
+def _scratch_task_argument():
+    try:
+        return _my.scratch_task_argument
+    except AttributeError:
+        result = _my.scratch_task_argument = ffi.new('legion_task_argument_t *')
+        return result
+
 class DomainPoint(object):
     __slots__ = ['impl']
     def __init__(self, value):
@@ -165,21 +327,107 @@ class DomainPoint(object):
     def raw_value(self):
         return self.impl[0]
 
+# numba is optional, and slow enough to import that it is only loaded
+# once something actually needs it.
+_numba = None
+_numba_imported = False
+
+def _import_numba():
+    global _numba, _numba_imported
+    if not _numba_imported:
+        try:
+            import numba
+        except ImportError:
+            numba = None
+        _numba = numba
+        _numba_imported = True
+    return _numba
+
+def _numba_error():
+    try:
+        from numba.core.errors import NumbaError
+    except ImportError: # numba < 0.49
+        from numba.errors import NumbaError
+    return NumbaError
+
+# Below this volume, the overhead of calling into compiled code
+# outweighs the cost of enumerating the points with numpy.
+_fill_coords_min_volume = 4096
+
+def _fill_coords(lo, hi, out):
+    # Fills out with the points of the rect [lo, hi], with the first
+    # dimension varying fastest. Compiled with numba on first use.
+    dim = lo.shape[0]
+    point = lo.copy()
+    for n in range(out.shape[0]):
+        for i in range(dim):
+            out[n, i] = point[i]
+        for i in range(dim):
+            if point[i] < hi[i]:
+                point[i] += 1
+                break
+            point[i] = lo[i]
+
+_fill_coords_compiled = None
+
+def _get_fill_coords():
+    # Returns the compiled _fill_coords, or None without numba.
+    global _fill_coords_compiled
+    if _fill_coords_compiled is None:
+        numba = _import_numba()
+        if numba is None:
+            return None
+        _fill_coords_compiled = numba.njit(cache=True)(_fill_coords)
+    return _fill_coords_compiled
+
 class Domain(object):
     __slots__ = ['impl']
     def __init__(self, extent, start=None):
         if start is not None:
             assert len(start) == len(extent)
         else:
-            start = [0 for _ in extent]
-        assert 1 <= len(extent) <= 3
-        rect = ffi.new('legion_rect_{}d_t *'.format(len(extent)))
-        for i in xrange(len(extent)):
+            start = (0,) * len(extent)
+        dim = len(extent)
+        assert 1 <= dim <= _max_dim
+        rect, _ = _scratch_rect_and_offsets(dim)
+        for i in xrange(dim):
             rect[0].lo.x[i] = start[i]
             rect[0].hi.x[i] = start[i] + extent[i] - 1
-        self.impl = getattr(c, 'legion_domain_from_rect_{}d'.format(len(extent)))(rect[0])
+        self.impl = _domain_from_rect[dim](rect[0])
     def raw_value(self):
         return self.impl
+    def points_ndarray(self):
+        # Returns every point in the domain as a (volume, dim) array,
+        # ordered with the first dimension varying fastest. This
+        # avoids a Python-level loop over the points of the domain.
+        dim = self.impl.dim
+        rect_data = self.impl.rect_data
+        coords = numpy.array(ffi.unpack(rect_data, 2*dim), dtype=numpy.int64)
+        lo, hi = coords[:dim], coords[dim:]
+        volume = int(numpy.prod(numpy.maximum(hi - lo + 1, 0)))
+        if volume >= _fill_coords_min_volume:
+            fill_coords = _get_fill_coords()
+            if fill_coords is not None:
+                points = numpy.empty((volume, dim), dtype=numpy.int64)
+                fill_coords(lo, hi, points)
+                return points
+        grid = numpy.mgrid[tuple(
+            slice(rect_data[i], rect_data[dim + i] + 1) for i in xrange(dim))]
+        return numpy.stack(
+            [axis.ravel(order='F') for axis in grid], axis=1).astype(numpy.int64)
+
+# Pointer ctypes and sizes of typed future values, keyed by C type
+# name, so that repeated gets do not have to reparse the type.
+_future_value_types = {}
+
+def _future_value_type(value_type):
+    try:
+        return _future_value_types[value_type]
+    except KeyError:
+        result = (ffi.typeof(ffi.getctype(value_type, '*')),
+                  ffi.sizeof(value_type))
+        _future_value_types[value_type] = result
+        return result
 
 class Future(object):
     __slots__ = ['handle', 'value_type']
@@ -196,23 +444,24 @@ class Future(object):
             value_size = c.legion_future_get_untyped_size(self.handle)
             assert value_size > 0
             value_str = ffi.unpack(ffi.cast('char *', value_ptr), value_size)
-            value = pickle.loads(value_str)
+            value = _decode_value(value_str)
             return value
         else:
-            expected_size = ffi.sizeof(self.value_type)
+            value_ptr_type, expected_size = _future_value_type(self.value_type)
 
             value_ptr = c.legion_future_get_untyped_pointer(self.handle)
             value_size = c.legion_future_get_untyped_size(self.handle)
             assert value_size == expected_size
-            value = ffi.cast(ffi.getctype(self.value_type, '*'), value_ptr)[0]
+            value = ffi.cast(value_ptr_type, value_ptr)[0]
             return value
 
 class Type(object):
-    __slots__ = ['numpy_type', 'size']
+    __slots__ = ['numpy_type', 'dtype', 'size']
 
     def __init__(self, numpy_type):
         self.numpy_type = numpy_type
-        self.size = numpy.dtype(numpy_type).itemsize
+        self.dtype = numpy.dtype(numpy_type)
+        self.size = self.dtype.itemsize
 
     def __reduce__(self):
         return (Type, (self.numpy_type,))
@@ -229,45 +478,63 @@ uint32 = Type(numpy.uint32)
 uint64 = Type(numpy.uint64)
 
 class Privilege(object):
-    __slots__ = ['read', 'write', 'discard']
+    __slots__ = ['read', 'write', 'discard', '_key', '_hash', '_bits']
+
+    # Fields the privilege is restricted to (see PrivilegeFields), or
+    # None for all fields. Checking this is cheaper than hasattr.
+    fields = None
 
     def __init__(self, read=False, write=False, discard=False):
         self.read = read
         self.write = write
         self.discard = discard
 
+        # Privileges are immutable, so everything needed to compare
+        # them and to issue launches with them is computed up front.
+        self._key = (read, write, discard)
+        self._hash = hash(self._key)
+        bits = 0
+        if discard:
+            assert write
+            bits |= 2 # WRITE_DISCARD
+        else:
+            if write: bits = 7 # READ_WRITE
+            elif read: bits = 1 # READ_ONLY
+        self._bits = bits
+
     def _fields(self):
-        return (self.read, self.write, self.discard)
+        return self._key
 
     def __eq__(self, other):
-        return isinstance(other, Privilege) and self._fields() == other._fields()
+        return isinstance(other, Privilege) and self._key == other._key
 
     def __cmp__(self, other):
         assert isinstance(other, Privilege)
-        return self._fields().__cmp__(other._fields())
+        return self._key.__cmp__(other._key)
 
     def __hash__(self):
-        return hash(self._fields())
+        return self._hash
 
     def __call__(self, fields):
         return PrivilegeFields(self, fields)
 
     def _legion_privilege(self):
-        bits = 0
-        if self.discard:
-            assert self.write
-            bits |= 2 # WRITE_DISCARD
-        else:
-            if self.write: bits = 7 # READ_WRITE
-            elif self.read: bits = 1 # READ_ONLY
-        return bits
+        return self._bits
 
 class PrivilegeFields(Privilege):
-    __slots__ = ['read', 'write', 'discard', 'fields']
+    __slots__ = ['read', 'write', 'discard', 'fields', '_field_set']
 
     def __init__(self, privilege, fields):
         Privilege.__init__(self, privilege.read, privilege.write, privilege.discard)
         self.fields = fields
+        self._field_set = None
+
+    def _get_field_set(self):
+        # Fields are looked up by name once per field on every launch,
+        # so the set of names is built on first use and kept.
+        if self._field_set is None:
+            self._field_set = frozenset(self.fields)
+        return self._field_set
 
 # Pre-defined Privileges
 N = Privilege()
@@ -276,71 +543,115 @@ RO = Privilege(read=True)
 RW = Privilege(read=True, write=True)
 WD = Privilege(write=True, discard=True)
 
+# Handle types are resolved once, since handles are allocated every
+# time one of these objects is created or unpickled.
+_index_space_ptr_type = ffi.typeof('legion_index_space_t *')
+_field_space_ptr_type = ffi.typeof('legion_field_space_t *')
+_logical_region_ptr_type = ffi.typeof('legion_logical_region_t *')
+
 # Hack: Can't pickle static methods.
 def _Ispace_unpickle(ispace_tid, ispace_id, ispace_type_tag):
-    handle = ffi.new('legion_index_space_t *')
-    handle[0].tid = ispace_tid
-    handle[0].id = ispace_id
-    handle[0].type_tag = ispace_type_tag
-    return Ispace(handle[0])
+    handle = ffi.new(_index_space_ptr_type, {
+        'tid': ispace_tid, 'id': ispace_id, 'type_tag': ispace_type_tag})
+    return Ispace(handle, take_ownership=True)
 
 class Ispace(object):
-    __slots__ = ['handle']
+    __slots__ = ['handle', '_domain', '_reduce_args']
 
-    def __init__(self, handle):
-        # Important: Copy handle. Do NOT assume ownership.
-        self.handle = ffi.new('legion_index_space_t *', handle)
+    def __init__(self, handle, take_ownership=False):
+        if take_ownership:
+            # The caller hands over a freshly allocated pointer.
+            self.handle = handle
+        else:
+            # Important: Copy handle. Do NOT assume ownership.
+            self.handle = ffi.new(_index_space_ptr_type, handle)
+        self._domain = None
+        self._reduce_args = None
 
     def __reduce__(self):
-        return (_Ispace_unpickle,
-                (self.handle[0].tid,
-                 self.handle[0].id,
-                 self.handle[0].type_tag))
+        # Note: Handles never change after construction, so the fields
+        # only need to be read out of the struct once.
+        if self._reduce_args is None:
+            handle = self.handle[0]
+            self._reduce_args = (handle.tid, handle.id, handle.type_tag)
+        return (_Ispace_unpickle, self._reduce_args)
 
     @staticmethod
     def create(extent, start=None):
+        ctx = _my.ctx
         domain = Domain(extent, start=start).raw_value()
-        handle = c.legion_index_space_create_domain(_my.ctx.runtime, _my.ctx.context, domain)
-        return Ispace(handle)
+        handle = c.legion_index_space_create_domain(ctx.runtime, ctx.context, domain)
+        result = Ispace(handle)
+        result._domain = domain
+        return result
+
+    def _get_domain(self):
+        # Index spaces are immutable, so the domain only needs to be
+        # fetched from the runtime once.
+        if self._domain is None:
+            self._domain = c.legion_index_space_get_domain(
+                _my.ctx.runtime, self.handle[0])
+        return self._domain
+
+_auto_generate_field_id = ffi.cast('legion_field_id_t', -1) # AUTO_GENERATE_ID
 
 # Hack: Can't pickle static methods.
 def _Fspace_unpickle(fspace_id, field_ids, field_types):
-    handle = ffi.new('legion_field_space_t *')
-    handle[0].id = fspace_id
-    return Fspace(handle[0], field_ids, field_types)
+    handle = ffi.new(_field_space_ptr_type, {'id': fspace_id})
+    return Fspace(handle, field_ids, field_types, take_ownership=True)
 
 class Fspace(object):
-    __slots__ = ['handle', 'field_ids', 'field_types']
+    __slots__ = ['handle', 'field_ids', 'field_types',
+                 '_field_set', '_reduce_id']
 
-    def __init__(self, handle, field_ids, field_types):
-        # Important: Copy handle. Do NOT assume ownership.
-        self.handle = ffi.new('legion_field_space_t *', handle)
+    def __init__(self, handle, field_ids, field_types, take_ownership=False):
+        if take_ownership:
+            # The caller hands over a freshly allocated pointer.
+            self.handle = handle
+        else:
+            # Important: Copy handle. Do NOT assume ownership.
+            self.handle = ffi.new(_field_space_ptr_type, handle)
         self.field_ids = field_ids
         self.field_types = field_types
+        self._field_set = None
+        self._reduce_id = None
+
+    def _get_field_set(self):
+        # Field spaces are not modified after creation, so the set of
+        # field names is built on first use and kept.
+        if self._field_set is None:
+            self._field_set = frozenset(self.field_ids)
+        return self._field_set
 
     def __reduce__(self):
+        if self._reduce_id is None:
+            self._reduce_id = self.handle[0].id
         return (_Fspace_unpickle,
-                (self.handle[0].id,
+                (self._reduce_id,
                  self.field_ids,
                  self.field_types))
 
     @staticmethod
     def create(fields):
-        handle = c.legion_field_space_create(_my.ctx.runtime, _my.ctx.context)
-        alloc = c.legion_field_allocator_create(
-            _my.ctx.runtime, _my.ctx.context, handle)
+        # Note: Bind the context once rather than going through
+        # thread-local storage for every field.
+        ctx = _my.ctx
+        runtime = ctx.runtime
+        handle = c.legion_field_space_create(runtime, ctx.context)
+        alloc = c.legion_field_allocator_create(runtime, ctx.context, handle)
+        allocate_field = c.legion_field_allocator_allocate_field
+        attach_name = c.legion_field_id_attach_name
         field_ids = {}
         field_types = {}
         for field_name, field_entry in fields.items():
-            try:
-                field_type, field_id = field_entry
-            except TypeError:
+            if isinstance(field_entry, Type):
                 field_type = field_entry
-                field_id = ffi.cast('legion_field_id_t', -1) # AUTO_GENERATE_ID
-            field_id = c.legion_field_allocator_allocate_field(
-                alloc, field_type.size, field_id)
-            c.legion_field_id_attach_name(
-                _my.ctx.runtime, handle, field_id, field_name.encode('utf-8'), False)
+                field_id = _auto_generate_field_id
+            else:
+                field_type, field_id = field_entry
+            field_id = allocate_field(alloc, field_type.size, field_id)
+            attach_name(
+                runtime, handle, field_id, _encode_utf8(field_name), False)
             field_ids[field_name] = field_id
             field_types[field_name] = field_type
         c.legion_field_allocator_destroy(alloc)
@@ -348,30 +659,38 @@ class Fspace(object):
 
 # Hack: Can't pickle static methods.
 def _Region_unpickle(tree_id, ispace, fspace):
-    handle = ffi.new('legion_logical_region_t *')
-    handle[0].tree_id = tree_id
-    handle[0].index_space.tid = ispace.handle[0].tid
-    handle[0].index_space.id = ispace.handle[0].id
-    handle[0].field_space.id = fspace.handle[0].id
-
-    return Region(handle[0], ispace, fspace)
+    handle = ffi.new(_logical_region_ptr_type, {
+        'tree_id': tree_id,
+        'index_space': ispace.handle[0],
+        'field_space': fspace.handle[0]})
+    return Region(handle, ispace, fspace, take_ownership=True)
 
 class Region(object):
     __slots__ = ['handle', 'ispace', 'fspace',
-                 'instances', 'privileges', 'instance_wrappers']
+                 'instances', 'privileges', 'instance_wrappers',
+                 '_reduce_tree_id']
 
-    def __init__(self, handle, ispace, fspace):
-        # Important: Copy handle. Do NOT assume ownership.
-        self.handle = ffi.new('legion_logical_region_t *', handle)
+    def __init__(self, handle, ispace, fspace, take_ownership=False):
+        if take_ownership:
+            # The caller hands over a freshly allocated pointer.
+            self.handle = handle
+        else:
+            # Important: Copy handle. Do NOT assume ownership.
+            self.handle = ffi.new(_logical_region_ptr_type, handle)
         self.ispace = ispace
         self.fspace = fspace
-        self.instances = {}
-        self.privileges = {}
-        self.instance_wrappers = {}
+        # Regions are frequently created just to be passed along, so
+        # these are only allocated once something is stored in them.
+        self.instances = None
+        self.privileges = None
+        self.instance_wrappers = None
+        self._reduce_tree_id = None
 
     def __reduce__(self):
+        if self._reduce_tree_id is None:
+            self._reduce_tree_id = self.handle[0].tree_id
         return (_Region_unpickle,
-                (self.handle[0].tree_id,
+                (self._reduce_tree_id,
                  self.ispace,
                  self.fspace))
 
@@ -381,8 +700,9 @@ class Region(object):
             ispace = Ispace.create(ispace)
         if not isinstance(fspace, Fspace):
             fspace = Fspace.create(fspace)
+        ctx = _my.ctx
         handle = c.legion_logical_region_create(
-            _my.ctx.runtime, _my.ctx.context, ispace.handle[0], fspace.handle[0])
+            ctx.runtime, ctx.context, ispace.handle[0], fspace.handle[0])
         result = Region(handle, ispace, fspace)
         for field_name in fspace.field_ids.keys():
             result.set_privilege(field_name, RW)
@@ -391,8 +711,8 @@ class Region(object):
     def destroy(self):
         # This is not something you want to have happen in a
         # destructor, since regions may outlive the lifetime of the handle.
-        c.legion_logical_region_destroy(
-            _my.ctx.runtime, _my.ctx.context, self.handle[0])
+        ctx = _my.ctx
+        c.legion_logical_region_destroy(ctx.runtime, ctx.context, self.handle[0])
         # Clear out references. Technically unnecessary but avoids abuse.
         del self.instance_wrappers
         del self.instances
@@ -401,40 +721,62 @@ class Region(object):
         del self.fspace
 
     def set_privilege(self, field_name, privilege):
+        if self.privileges is None:
+            self.privileges = {}
         assert field_name not in self.privileges
         self.privileges[field_name] = privilege
 
     def set_instance(self, field_name, instance, privilege=None):
+        if self.instances is None:
+            self.instances = {}
         assert field_name not in self.instances
         self.instances[field_name] = instance
         if privilege is not None:
-            assert field_name not in self.privileges
-            self.privileges[field_name] = privilege
+            self.set_privilege(field_name, privilege)
 
     def map_inline(self):
-        fields_by_privilege = collections.defaultdict(set)
-        for field_name, privilege in self.privileges.iteritems():
-            fields_by_privilege[privilege].add(field_name)
-        for privilege, field_names  in fields_by_privilege.iteritems():
+        ctx = _my.ctx
+        field_ids = self.fspace.field_ids
+        privileges = self.privileges
+        if not privileges:
+            return
+
+        # Fields that share a privilege are mapped with one launcher.
+        # In the common case (e.g. a freshly created region) every
+        # field has the same privilege object, so skip the grouping.
+        first_privilege = next(iter(privileges.values()))
+        if all(privilege is first_privilege for privilege in privileges.values()):
+            launches = [(first_privilege, list(privileges.keys()))]
+        else:
+            fields_by_privilege = collections.defaultdict(list)
+            for field_name, privilege in privileges.items():
+                fields_by_privilege[privilege].append(field_name)
+            launches = sorted(
+                fields_by_privilege.items(),
+                key=lambda launch: launch[0]._legion_privilege())
+
+        add_field = c.legion_inline_launcher_add_field
+        for privilege, field_names in launches:
             launcher = c.legion_inline_launcher_create_logical_region(
                 self.handle[0],
                 privilege._legion_privilege(), 0, # EXCLUSIVE
                 self.handle[0],
                 0, False, 0, 0)
             for field_name in field_names:
-                c.legion_inline_launcher_add_field(
-                    launcher, self.fspace.field_ids[field_name], True)
+                add_field(launcher, field_ids[field_name], True)
             instance = c.legion_inline_launcher_execute(
-                _my.ctx.runtime, _my.ctx.context, launcher)
+                ctx.runtime, ctx.context, launcher)
             for field_name in field_names:
                 self.set_instance(field_name, instance)
 
     def __getattr__(self, field_name):
         if field_name in self.fspace.field_ids:
-            if field_name not in self.instances:
-                if self.privileges[field_name] is None:
+            if self.instances is None or field_name not in self.instances:
+                if self.privileges is None or self.privileges.get(field_name) is None:
                     raise Exception('Invalid attempt to access field "%s" without privileges' % field_name)
                 self.map_inline()
+            if self.instance_wrappers is None:
+                self.instance_wrappers = {}
             if field_name not in self.instance_wrappers:
                 self.instance_wrappers[field_name] = RegionField(
                     self, field_name)
@@ -447,8 +789,7 @@ class RegionField(numpy.ndarray):
     # https://docs.scipy.org/doc/numpy/user/basics.subclassing.html
     def __new__(cls, region, field_name):
         accessor = RegionField._get_accessor(region, field_name)
-        initializer = RegionField._get_array_initializer(region, field_name, accessor)
-        obj = numpy.asarray(initializer).view(cls)
+        obj = RegionField._get_array(region, field_name, accessor).view(cls)
 
         obj.accessor = accessor
         return obj
@@ -458,22 +799,18 @@ class RegionField(numpy.ndarray):
         # Note: the accessor needs to be kept alive, to make sure to
         # save the result of this function in an instance variable.
         instance = region.instances[field_name]
-        domain = c.legion_index_space_get_domain(
-            _my.ctx.runtime, region.ispace.handle[0])
-        dim = domain.dim
-        get_accessor = getattr(c, 'legion_physical_region_get_field_accessor_array_{}d'.format(dim))
-        return get_accessor(instance, region.fspace.field_ids[field_name])
+        dim = region.ispace._get_domain().dim
+        return _get_field_accessor_array[dim](
+            instance, region.fspace.field_ids[field_name])
 
     @staticmethod
     def _get_base_and_stride(region, field_name, accessor):
-        domain = c.legion_index_space_get_domain(
-            _my.ctx.runtime, region.ispace.handle[0])
+        domain = region.ispace._get_domain()
         dim = domain.dim
-        rect = getattr(c, 'legion_domain_get_rect_{}d'.format(dim))(domain)
-        subrect = ffi.new('legion_rect_{}d_t *'.format(dim))
-        offsets = ffi.new('legion_byte_offset_t[]', dim)
+        rect = _domain_get_rect[dim](domain)
+        subrect, offsets = _scratch_rect_and_offsets(dim)
 
-        base_ptr = getattr(c, 'legion_accessor_array_{}d_raw_rect_ptr'.format(dim))(
+        base_ptr = _accessor_array_raw_rect_ptr[dim](
             accessor, rect, subrect, offsets)
         assert base_ptr
         for i in xrange(dim):
@@ -487,31 +824,22 @@ class RegionField(numpy.ndarray):
         return base_ptr, shape, strides
 
     @staticmethod
-    def _get_array_initializer(region, field_name, accessor):
+    def _get_array(region, field_name, accessor):
         base_ptr, shape, strides = RegionField._get_base_and_stride(
             region, field_name, accessor)
         field_type = region.fspace.field_types[field_name]
 
-        # Numpy doesn't know about CFFI pointers, so we have to cast
-        # this to a Python long before we can hand it off to Numpy.
-        base_ptr = long(ffi.cast("size_t", base_ptr))
-
-        return _RegionNdarray(shape, field_type, base_ptr, strides, False)
-
-# This is a dummy object that is only used as an initializer for the
-# RegionField object above. It is thrown away as soon as the
-# RegionField is constructed.
-class _RegionNdarray(object):
-    __slots__ = ['__array_interface__']
-    def __init__(self, shape, field_type, base_ptr, strides, read_only):
-        # See: https://docs.scipy.org/doc/numpy/reference/arrays.interface.html
-        self.__array_interface__ = {
-            'version': 3,
-            'shape': shape,
-            'typestr': numpy.dtype(field_type.numpy_type).str,
-            'data': (base_ptr, read_only),
-            'strides': strides,
-        }
+        # Wrap the instance memory in a buffer large enough to reach
+        # the last element under the given strides, and view it
+        # directly as an array.
+        if all(shape):
+            size = field_type.size + sum(
+                (extent - 1) * stride for extent, stride in zip(shape, strides))
+        else:
+            size = 0
+        data = ffi.buffer(ffi.cast('char *', base_ptr), size)
+        return numpy.ndarray(
+            shape, dtype=field_type.dtype, buffer=data, strides=strides)
 
 class ExternTask(object):
     __slots__ = ['privileges', 'calling_convention', 'task_id']
@@ -528,20 +856,39 @@ class ExternTask(object):
         return self.spawn_task(*args)
 
     def spawn_task(self, *args):
-        if _my.ctx.current_launch:
-            return _my.ctx.current_launch.spawn_task(self, *args)
+        current_launch = _my.ctx.current_launch
+        if current_launch:
+            return current_launch.spawn_task(self, *args)
         return TaskLaunch().spawn_task(self, *args)
 
 def extern_task(**kwargs):
     return ExternTask(**kwargs)
 
 class Task (object):
-    __slots__ = ['body', 'privileges', 'leaf', 'inner', 'idempotent', 'calling_convention', 'task_id']
+    __slots__ = ['body', 'jit_body', 'privileges', 'leaf', 'inner', 'idempotent', 'calling_convention', 'task_id']
 
     def __init__(self, body, privileges=None,
                  leaf=False, inner=False, idempotent=False,
-                 register=True):
+                 jit=False, register=True):
         self.body = body
+        # Optionally compile the body with numba. Only the arguments
+        # numba understands (numbers, tuples of them, and numpy
+        # arrays) can be passed to such a task, so tasks which take
+        # regions (i.e. have privileges) cannot be compiled. The plain
+        # body is kept, since it is what the task is registered under.
+        if jit:
+            if privileges is not None:
+                raise Exception('jit=True is not supported for tasks with privileges')
+            numba = _import_numba()
+            if numba is None:
+                raise Exception('jit=True requires numba, which is not installed')
+            try:
+                self.jit_body = numba.njit(cache=True)(body)
+            except RuntimeError:
+                # The body has no source file to cache against.
+                self.jit_body = numba.njit(body)
+        else:
+            self.jit_body = None
         if privileges is not None:
             privileges = [(x if x is not None else N) for x in privileges]
         self.privileges = privileges
@@ -568,12 +915,15 @@ class Task (object):
             return self.spawn_task(*args)
 
     def spawn_task(self, *args):
-        if _my.ctx.current_launch:
-            return _my.ctx.current_launch.spawn_task(self, *args)
+        current_launch = _my.ctx.current_launch
+        if current_launch:
+            return current_launch.spawn_task(self, *args)
         return TaskLaunch().spawn_task(self, *args)
 
     def execute_task(self, raw_args, user_data, proc):
-        raw_arg_ptr = ffi.new('char[]', bytes(raw_args))
+        # Note: The preamble only reads the arguments during the call,
+        # so it is given a pointer into the bytearray without copying.
+        raw_arg_ptr = ffi.from_buffer(raw_args)
         raw_arg_size = len(raw_args)
 
         # Execute preamble to obtain Legion API context.
@@ -586,7 +936,7 @@ class Task (object):
             raw_arg_ptr, raw_arg_size, proc,
             task, raw_regions, num_regions, context, runtime)
 
-        # Decode arguments from Pickle format.
+        # Decode arguments.
         if c.legion_task_get_is_index_space(task[0]):
             arg_ptr = ffi.cast('char *', c.legion_task_get_local_args(task[0]))
             arg_size = c.legion_task_get_local_arglen(task[0])
@@ -595,34 +945,34 @@ class Task (object):
             arg_size = c.legion_task_get_arglen(task[0])
 
         if arg_size > 0 and c.legion_task_get_depth(task[0]) > 0:
-            args = pickle.loads(ffi.unpack(arg_ptr, arg_size))
+            args = _decode_value(ffi.unpack(arg_ptr, arg_size))
         else:
             args = ()
 
-        # Unpack regions.
-        regions = []
-        for i in xrange(num_regions[0]):
-            regions.append(raw_regions[0][i])
-
         # Unpack physical regions.
+        regions = raw_regions[0]
         if self.privileges is not None:
             req = 0
-            for i, arg in zip(range(len(args)), args):
+            for i, arg in enumerate(args):
                 if isinstance(arg, Region):
                     assert req < num_regions[0] and req < len(self.privileges)
-                    instance = raw_regions[0][req]
+                    instance = regions[req]
                     req += 1
 
                     priv = self.privileges[i]
-                    if hasattr(priv, 'fields'):
-                        assert set(priv.fields) <= set(arg.fspace.field_ids.keys())
-                    for name, fid in arg.fspace.field_ids.items():
-                        if not hasattr(priv, 'fields') or name in priv.fields:
+                    if priv.fields is not None:
+                        field_set = priv._get_field_set()
+                        assert field_set <= arg.fspace._get_field_set()
+                        for name in arg.fspace.field_ids:
+                            if name in field_set:
+                                arg.set_instance(name, instance, priv)
+                    else:
+                        for name in arg.fspace.field_ids:
                             arg.set_instance(name, instance, priv)
             assert req == num_regions[0]
 
         # Build context.
-        ctx = Context(context, runtime, task, regions)
+        ctx = Context(context, runtime, task, raw_regions, num_regions[0])
 
         # Ensure that we're not getting tangled up in another
         # thread. There should be exactly one thread per task.
@@ -637,17 +987,28 @@ class Task (object):
         _my.ctx = ctx
 
         # Execute task body.
-        result = self.body(*args)
-
-        # Encode result in Pickle format.
-        if result is not None:
-            result_str = pickle.dumps(result, protocol=_pickle_version)
-            result_size = len(result_str)
-            result_ptr = ffi.new('char[]', result_size)
-            ffi.buffer(result_ptr, result_size)[:] = result_str
+        if self.jit_body is not None:
+            try:
+                result = self.jit_body(*args)
+            except _numba_error() as e:
+                # The body failed to compile, so run it as plain Python
+                # from now on.
+                warnings.warn(
+                    'unable to compile task %s.%s with numba, running it '
+                    'as Python instead: %s' % (
+                        self.body.__module__, self.body.__name__, e))
+                self.jit_body = None
+                result = self.body(*args)
         else:
-            result_size = 0
-            result_ptr = ffi.NULL
+            result = self.body(*args)
+
+        # Encode result. Note: None is encoded too (as a single tag
+        # byte), so that getting the future of such a task works.
+        result_str = _encode_value(result)
+        result_size = len(result_str)
+        # The postamble copies the result, so it is safe to pass a
+        # pointer directly into the encoded string.
+        result_ptr = ffi.from_buffer(result_str)
 
         # Execute postamble.
         c.legion_task_postamble(runtime[0], context[0], result_ptr, result_size)
@@ -670,16 +1031,18 @@ class Task (object):
         options[0].inner = self.inner
         options[0].idempotent = self.idempotent
 
-        task_name = ('%s.%s' % (self.body.__module__, self.body.__name__))
+        module_name = _encode_utf8(self.body.__module__)
+        function_name = self.body.__name__.encode('utf-8')
+        task_name = b'.'.join((module_name, function_name))
 
         task_id = c.legion_runtime_preregister_task_variant_python_source(
             ffi.cast('legion_task_id_t', -1), # AUTO_GENERATE_ID
-            task_name.encode('utf-8'),
+            task_name,
             execution_constraints,
             layout_constraints,
             options[0],
-            self.body.__module__.encode('utf-8'),
-            self.body.__name__.encode('utf-8'),
+            module_name,
+            function_name,
             ffi.NULL,
             0)
 
@@ -703,59 +1066,77 @@ class _TaskLauncher(object):
         self.calling_convention = calling_convention
 
     def preprocess_args(self, *args):
-        return [
-            arg._legion_preprocess_task_argument()
-            if hasattr(arg, '_legion_preprocess_task_argument') else arg
-            for arg in args]
+        # Returns the arguments to pass to the task, along with the
+        # positions of the region arguments among them, in one pass.
+        result = []
+        region_indices = []
+        # Note: Regions are checked first, since looking up a missing
+        # attribute on a region goes through its field lookup.
+        for i, arg in enumerate(args):
+            if isinstance(arg, Region):
+                region_indices.append(i)
+            elif hasattr(arg, '_legion_preprocess_task_argument'):
+                arg = arg._legion_preprocess_task_argument()
+            result.append(arg)
+        return tuple(result), region_indices
 
     def encode_args(self, *args):
-        task_args = ffi.new('legion_task_argument_t *')
-        task_args_buffer = None
         if self.calling_convention == 'python':
-            arg_str = pickle.dumps(args, protocol=_pickle_version)
-            task_args_buffer = ffi.new('char[]', arg_str)
-            task_args[0].args = task_args_buffer
-            task_args[0].arglen = len(arg_str)
-        else:
-            # FIXME: External tasks need a dedicated calling
-            # convention to permit the passing of task arguments.
-            task_args[0].args = ffi.NULL
-            task_args[0].arglen = 0
+            return self.encode_arg_str(_encode_value(args))
+        # FIXME: External tasks need a dedicated calling
+        # convention to permit the passing of task arguments.
+        return _empty_task_argument, None
+
+    def encode_arg_str(self, arg_str):
+        task_args = _scratch_task_argument()
+        # The runtime copies the arguments when the task is
+        # launched, so the encoded string can be used in place.
+        task_args_buffer = ffi.from_buffer(arg_str)
+        task_args[0].args = task_args_buffer
+        task_args[0].arglen = len(arg_str)
         # WARNING: Need to return the interior buffer or else it will be GC'd
         return task_args, task_args_buffer
 
     def spawn_task(self, *args):
-        assert(isinstance(_my.ctx, Context))
-
-        args = self.preprocess_args(*args)
+        ctx = _my.ctx
+        assert(isinstance(ctx, Context))
+
+        args, region_indices = self.preprocess_args(*args)
+        if self.calling_convention is None and len(region_indices) < len(args):
+            # FIXME: Task arguments aren't being encoded AT ALL;
+            # at least throw an exception so that the user knows
+            raise Exception('External tasks do not support non-region arguments')
         task_args, _ = self.encode_args(*args)
 
         # Construct the task launcher.
         launcher = c.legion_task_launcher_create(
             self.task_id, task_args[0], c.legion_predicate_true(), 0, 0)
-        for i, arg in zip(range(len(args)), args):
-            if isinstance(arg, Region):
-                assert i < len(self.privileges)
-                priv = self.privileges[i]
-                req = c.legion_task_launcher_add_region_requirement_logical_region(
-                    launcher, arg.handle[0],
-                    priv._legion_privilege(),
-                    0, # EXCLUSIVE
-                    arg.handle[0], 0, False)
-                if hasattr(priv, 'fields'):
-                    assert set(priv.fields) <= set(arg.fspace.field_ids.keys())
-                for name, fid in arg.fspace.field_ids.items():
-                    if not hasattr(priv, 'fields') or name in priv.fields:
-                        c.legion_task_launcher_add_field(
-                            launcher, req, fid, True)
-            elif self.calling_convention is None:
-                # FIXME: Task arguments aren't being encoded AT ALL;
-                # at least throw an exception so that the user knows
-                raise Exception('External tasks do not support non-region arguments')
+        add_region_requirement = c.legion_task_launcher_add_region_requirement_logical_region
+        add_field = c.legion_task_launcher_add_field
+        for i in region_indices:
+            arg = args[i]
+            assert i < len(self.privileges)
+            priv = self.privileges[i]
+            handle = arg.handle[0]
+            req = add_region_requirement(
+                launcher, handle,
+                priv._legion_privilege(),
+                0, # EXCLUSIVE
+                handle, 0, False)
+            field_ids = arg.fspace.field_ids
+            if priv.fields is not None:
+                field_set = priv._get_field_set()
+                assert field_set <= arg.fspace._get_field_set()
+                for name, fid in field_ids.items():
+                    if name in field_set:
+                        add_field(launcher, req, fid, True)
+            else:
+                for fid in field_ids.values():
+                    add_field(launcher, req, fid, True)
 
         # Launch the task.
         result = c.legion_task_launcher_execute(
-            _my.ctx.runtime, _my.ctx.context, launcher)
+            ctx.runtime, ctx.context, launcher)
         c.legion_task_launcher_destroy(launcher)
 
         # Build future of result.
@@ -763,15 +1144,30 @@ class _TaskLauncher(object):
         c.legion_future_destroy(result)
         return future
 
+# Types whose values cannot change once passed as an argument, and
+# for which equal values of the same type always encode identically.
+# Note: float is deliberately excluded, since 0.0 == -0.0 but the two
+# encode differently.
+_immutable_arg_types = frozenset([
+    type(None), bool, int, long, bytes, type('')])
+
 class _IndexLauncher(_TaskLauncher):
     __slots__ = ['task_id', 'privileges', 'calling_convention',
-                 'domain', 'local_args']
+                 'domain', 'local_args', 'point', 'last_arg_key',
+                 'last_arg_str', 'last_arg_str_buffer']
 
     def __init__(self, task_id, privileges, calling_convention, domain):
         super(_IndexLauncher, self).__init__(
             task_id, privileges, calling_convention)
         self.domain = domain
         self.local_args = c.legion_argument_map_create()
+        # The argument map copies the points it is given, so a single
+        # point is reused for the whole launch.
+        self.point = ffi.new('legion_domain_point_t *')
+        self.point[0].dim = 1
+        self.last_arg_key = None
+        self.last_arg_str = None
+        self.last_arg_str_buffer = (None, None)
 
     def __del__(self):
         c.legion_argument_map_destroy(self.local_args)
@@ -779,28 +1175,56 @@ class _IndexLauncher(_TaskLauncher):
     def spawn_task(self, *args):
         raise Exception('IndexLaunch does not support spawn_task')
 
+    def encode_local_args(self, args):
+        # Returns the encoded arguments, or None for no arguments.
+        if self.calling_convention != 'python':
+            # FIXME: External tasks need a dedicated calling
+            # convention to permit the passing of task arguments.
+            return None
+        # Note: Points of an index launch often pass the same
+        # arguments, so the last encoding is reused when the arguments
+        # are immutable and equal, including in type.
+        arg_types = tuple(map(type, args))
+        if not _immutable_arg_types.issuperset(arg_types):
+            return _encode_value(args)
+        key = (arg_types, args)
+        if key != self.last_arg_key:
+            self.last_arg_key = key
+            self.last_arg_str = _encode_value(args)
+        return self.last_arg_str
+
     def attach_local_args(self, index, *args):
-        point = DomainPoint(index)
-        args = self.preprocess_args(*args)
-        task_args, _ = self.encode_args(*args)
+        assert(isinstance(index, _IndexValue))
+        args, _ = self.preprocess_args(*args)
+        arg_str = self.encode_local_args(args)
+        point = self.point[0]
+        point.point_data[0] = int(index)
+        if arg_str is None:
+            c.legion_argument_map_set_point(
+                self.local_args, point, _empty_task_argument[0], False)
+            return
+        if arg_str is not self.last_arg_str_buffer[0]:
+            # The argument map copies the arguments, so the encoded
+            # string can be used in place.
+            self.last_arg_str_buffer = (arg_str, ffi.from_buffer(arg_str))
+        task_args = _scratch_task_argument()[0]
+        task_args.args = self.last_arg_str_buffer[1]
+        task_args.arglen = len(arg_str)
         c.legion_argument_map_set_point(
-            self.local_args, point.raw_value(), task_args[0], False)
+            self.local_args, point, task_args, False)
 
     def launch(self):
-        # All arguments are passed as local, so global is NULL.
-        global_args = ffi.new('legion_task_argument_t *')
-        global_args[0].args = ffi.NULL
-        global_args[0].arglen = 0
-
-        # Construct the task launcher.
+        # Construct the task launcher. All arguments are passed as
+        # local, so global is NULL.
         launcher = c.legion_index_launcher_create(
             self.task_id, self.domain.raw_value(),
-            global_args[0], self.local_args,
+            _empty_task_argument[0], self.local_args,
             c.legion_predicate_true(), False, 0, 0)
 
         # Launch the task.
+        ctx = _my.ctx
         result = c.legion_index_launcher_execute(
-            _my.ctx.runtime, _my.ctx.context, launcher)
+            ctx.runtime, ctx.context, launcher)
         c.legion_index_launcher_destroy(launcher)
 
         # TODO: Build future (map) of result.
@@ -844,12 +1268,13 @@ class IndexLaunch(object):
         self.saved_args = None
 
     def __iter__(self):
-        _my.ctx.begin_launch(self)
+        ctx = _my.ctx
+        ctx.begin_launch(self)
         self.point = _IndexValue(None)
         for i in xrange(self.extent[0]):
             self.point.value = i
             yield self.point
-        _my.ctx.end_launch(self)
+        ctx.end_launch(self)
         self.launch()
 
     def ensure_launcher(self, task):
@@ -876,9 +1301,9 @@ class IndexLaunch(object):
 
         if self.saved_args is None:
             self.saved_args = args
-        for arg, saved_arg in zip_longest(args, self.saved_args):
+        for arg in args:
             # TODO: Add support for region arguments
-            if isinstance(arg, Region) or isinstance(arg, RegionField):
+            if isinstance(arg, (Region, RegionField)):
                 raise Exception('TODO: Support region arguments to an IndexLaunch')
 
     def spawn_task(self, task, *args):
@@ -896,7 +1321,8 @@ def _dummy_task():
     return 1
 
 def execution_fence(block=False):
-    c.legion_runtime_issue_execution_fence(_my.ctx.runtime, _my.ctx.context)
+    ctx = _my.ctx
+    c.legion_runtime_issue_execution_fence(ctx.runtime, ctx.context)
     if block:
         _dummy_task().get()
 
@@ -916,8 +1342,9 @@ class Tunable(object):
 
     @staticmethod
     def select(tunable_id):
+        ctx = _my.ctx
         result = c.legion_runtime_select_tunable_value(
-            _my.ctx.runtime, _my.ctx.context, tunable_id, 0, 0)
+            ctx.runtime, ctx.context, tunable_id, 0, 0)
         future = Future(result, 'size_t')
         c.legion_future_destroy(result)
         return future
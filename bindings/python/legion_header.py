@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# Copyright 2018 Stanford University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Locates and preprocesses the Legion C API header for cffi. This is
+# kept separate from the legion module so that the build can run it
+# ahead of time without importing the bindings themselves.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import os
+import re
+import subprocess
+import sys
+
+# Headers that contribute to the preprocessed C API.
+legion_headers = [
+    'legion.h',
+    os.path.join('legion', 'legion_c.h'),
+    os.path.join('legion', 'legion_config.h'),
+    os.path.join('legion', 'legion_defines.h'),
+    os.path.join('realm', 'realm_c.h'),
+]
+
+# Name of the preprocessed header generated at build time. It lives
+# next to this module.
+preprocessed_header_name = 'legion_preprocessed.h'
+
+# The first line of a preprocessed header records the directory it
+# was generated from.
+_preprocessed_header_tag = '/* prefix_dir: %s */\n'
+
+def find_legion_header(runtime_dir=None):
+    def try_prefix(prefix_dir):
+        legion_h_path = os.path.join(prefix_dir, 'legion.h')
+        if os.path.exists(legion_h_path):
+            return prefix_dir, legion_h_path
+
+    # An explicit runtime directory (e.g. from the build) takes
+    # precedence over any of the guesses below
+    if runtime_dir is None:
+        runtime_dir = os.environ.get('LG_RT_DIR')
+    if runtime_dir:
+        result = try_prefix(os.path.realpath(runtime_dir))
+        if result:
+            return result
+        raise Exception('Unable to locate legion.h header file in %s' % runtime_dir)
+
+    # For in-source builds, find the header relative to the bindings
+    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    runtime_dir = os.path.join(root_dir, 'runtime')
+    result = try_prefix(runtime_dir)
+    if result:
+        return result
+
+    # If this was installed to a non-standard prefix, we might be able
+    # to guess from the directory structures
+    if os.path.basename(root_dir) == 'lib':
+        include_dir = os.path.join(os.path.dirname(root_dir), 'include')
+        result = try_prefix(include_dir)
+        if result:
+            return result
+
+    # Otherwise we have to hope that Legion is installed in a standard location
+    result = try_prefix('/usr/include')
+    if result:
+        return result
+
+    result = try_prefix('/usr/local/include')
+    if result:
+        return result
+
+    raise Exception('Unable to locate legion.h header file')
+
+def preprocess_legion_header(prefix_dir, legion_h_path):
+    header = subprocess.check_output(['gcc', '-I', prefix_dir, '-E', '-P', legion_h_path]).decode('utf-8')
+
+    # Hack: Fix for Ubuntu 16.04 versions of standard library headers:
+    header = re.sub(r'typedef struct {.+?} max_align_t;', '', header, flags=re.DOTALL)
+    return header
+
+def write_preprocessed_header(output_path, prefix_dir, legion_h_path):
+    header = preprocess_legion_header(prefix_dir, legion_h_path)
+    with io.open(output_path, 'w', encoding='utf-8') as f:
+        f.write(_preprocessed_header_tag % prefix_dir)
+        f.write(header)
+
+# Returns the contents of the preprocessed header generated at build
+# time, or None if it is missing, was generated from a different
+# prefix, or is older than any of the headers it was generated from.
+def read_preprocessed_header(prefix_dir, header_path):
+    if not os.path.exists(header_path):
+        return None
+    header_mtime = os.path.getmtime(header_path)
+    for header_name in legion_headers:
+        path = os.path.join(prefix_dir, header_name)
+        if os.path.exists(path) and os.path.getmtime(path) > header_mtime:
+            return None
+    with io.open(header_path, 'r', encoding='utf-8') as f:
+        if f.readline() != _preprocessed_header_tag % prefix_dir:
+            return None
+        return f.read()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3:
+        print('Usage: %s [output [runtime_dir]]' % sys.argv[0], file=sys.stderr)
+        sys.exit(1)
+    if len(sys.argv) >= 2:
+        output_path = sys.argv[1]
+    else:
+        output_path = os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            preprocessed_header_name)
+    runtime_dir = sys.argv[2] if len(sys.argv) == 3 else None
+    prefix_dir, legion_h_path = find_legion_header(runtime_dir)
+    write_preprocessed_header(output_path, prefix_dir, legion_h_path)
@@ -2,4 +2,4 @@ from distutils.core import setup
 
 setup(name='legion',
       version='0.1',
-      py_modules=['legion'])
+      py_modules=['legion', 'legion_header'])